@@ -1,4 +1,124 @@
 from MACDStrategy import MACD_Strategy
+import numpy as np
+from numba import njit
+from joblib import Parallel, delayed
+
+
+@njit(cache=True, nogil=True)
+def _running_extremes(close: np.ndarray, signal_idx: np.ndarray):
+    """
+    Calculates the running max and min of the closes from each signal onwards.
+    They are sorted, so the first bar reaching a take profit or stop loss is a binary search instead of a walk.
+    They do not depend on the ratios, so one pair of tables serves every ratio tested for a stock.
+
+    Args:
+        close (np.ndarray): The closing prices.
+        signal_idx (np.ndarray): The positions of the long signals.
+
+    Returns:
+        tuple: The running max and the negated running min, both of shape (signals, bars). Row k is filled up to the end of the prices.
+    """
+    n = close.shape[0]
+    n_signals = signal_idx.shape[0]
+    running_max = np.empty((n_signals, n), dtype=close.dtype)
+    running_min_neg = np.empty((n_signals, n), dtype=close.dtype) # negated so it is ascending like running_max
+    for k in range(n_signals):
+        signal = signal_idx[k]
+        running_max[k, 0] = close[signal]
+        running_min_neg[k, 0] = -close[signal]
+        for t in range(1, n - signal):
+            running_max[k, t] = max(running_max[k, t - 1], close[signal + t])
+            running_min_neg[k, t] = max(running_min_neg[k, t - 1], -close[signal + t])
+
+    return running_max, running_min_neg
+
+
+@njit(cache=True, nogil=True)
+def _eval_grid(close: np.ndarray, ema: np.ndarray, signal_idx: np.ndarray, running_max: np.ndarray, running_min_neg: np.ndarray, stop_ratios: np.ndarray, profit_ratios: np.ndarray, accuracy_weight: float, money_weight: float):
+    """
+    Backtests every stop ratio and profit ratio combination over the signals of a stock.
+    A combination is abandoned as soon as even winning every remaining signal could not beat the best score so far.
+
+    Args:
+        close (np.ndarray): The closing prices.
+        ema (np.ndarray): The EMA at each closing price.
+        signal_idx (np.ndarray): The positions of the long signals.
+        running_max (np.ndarray): The running max of the closes from each signal, given by _running_extremes.
+        running_min_neg (np.ndarray): The negated running min of the closes from each signal, given by _running_extremes.
+        stop_ratios (np.ndarray): The stop ratios to test.
+        profit_ratios (np.ndarray): The profit ratios to test.
+        accuracy_weight (float): The non-negative weight of the accuracy in the score.
+        money_weight (float): The non-negative weight of the money made in the score.
+
+    Returns:
+        tuple: The accuracy grid and the money grid, both of shape (stops, profits). Abandoned combinations are NaN.
+    """
+    n = close.shape[0]
+    n_signals = signal_idx.shape[0]
+    n_stops = stop_ratios.shape[0]
+    n_profits = profit_ratios.shape[0]
+    accuracy_grid = np.zeros((n_stops, n_profits))
+    money_grid = np.zeros((n_stops, n_profits))
+
+    # everything the grid needs per signal, looked up once instead of once per combination
+    signal_ema = np.empty(n_signals, dtype=ema.dtype)
+    signal_close = np.empty(n_signals, dtype=close.dtype)
+    signal_remaining = np.empty(n_signals, dtype=np.int64) # bars from the signal to the end
+    for k in range(n_signals):
+        signal_ema[k] = ema[signal_idx[k]]
+        signal_close[k] = close[signal_idx[k]]
+        signal_remaining[k] = n - signal_idx[k]
+
+    # every stop loss at once, shape (stops, signals)
+    stop_losses = np.outer(stop_ratios, signal_ema)
+
+    # sum of the EMA over the signals from k onwards, bounds the take profits still to come
+    ema_remaining = np.zeros(n_signals + 1)
+    for k in range(n_signals - 1, -1, -1):
+        ema_remaining[k] = ema_remaining[k + 1] + signal_ema[k]
+
+    best_score = -np.inf
+    for i in range(n_stops):
+        for j in range(n_profits):
+            current_wins = 0
+            current_money = 0.0
+            pruned = False
+            for k in range(n_signals):
+                stop_loss = stop_losses[i, k]
+                money_lost = signal_close[k] - stop_loss # money is lost when stop_loss is taken
+                take_profit = profit_ratios[j] * stop_loss
+
+                # first bar where either the take profit or the stop loss is reached, the take profit is checked first
+                remaining = signal_remaining[k]
+                take_profit_hit = np.searchsorted(running_max[k, :remaining], take_profit)
+                stop_loss_hit = np.searchsorted(running_min_neg[k, :remaining], -stop_loss)
+                won = False
+                if take_profit_hit < remaining and take_profit_hit <= stop_loss_hit:
+                    current_wins += 1
+                    current_money += take_profit
+                    won = True
+                elif stop_loss_hit < remaining:
+                    current_money -= money_lost
+
+                if not won:
+                    best_case_wins = current_wins + n_signals - k - 1
+                    best_case_money = current_money + profit_ratios[j] * stop_ratios[i] * ema_remaining[k + 1]
+                    if accuracy_weight * best_case_wins / n_signals + money_weight * best_case_money < best_score:
+                        pruned = True
+                        break
+
+            if pruned:
+                accuracy_grid[i, j] = np.nan
+                money_grid[i, j] = np.nan
+                continue
+
+            if n_signals > 0:
+                accuracy_grid[i, j] = current_wins / n_signals
+            money_grid[i, j] = current_money
+            best_score = max(best_score, accuracy_weight * accuracy_grid[i, j] + money_weight * current_money)
+
+    return accuracy_grid, money_grid
+
 
 class Backtester:
     """
@@ -6,23 +126,50 @@ class Backtester:
 
     Attributes:
         stocks (list[MACD_Strategy]): List of MACD trading strategies to backtest.
-        profit_ratios (list[float]): List of profit ratios to test.
-        stop_ratios (list[float]): List of stop ratios to test.
+        strategy (str): How the ratios are searched, one of 'grid', 'coarse', 'random' or 'bayes'.
+        n_trials (int): Number of pairs of ratios tested by the 'random' and 'bayes' strategies.
+        seed (int): Seed of the 'random' and 'bayes' samplers, None for a different draw every run.
+        profit_ratios (np.ndarray): Array of profit ratios to test.
+        stop_ratios (np.ndarray): Array of stop ratios to test.
+        profit_range (tuple[float, float]): Range of profit ratios sampled by the 'random' and 'bayes' strategies.
+        stop_range (tuple[float, float]): Range of stop ratios sampled by the 'random' and 'bayes' strategies.
+        accuracy_weight (float): Weight of the win rate when scoring a pair of ratios.
+        money_weight (float): Weight of the money made when scoring a pair of ratios.
         optimal_profit_ratio (list[float]): List of optimal profit ratios for each strategy.
         optimal_risk_ratio (list[float]): List of optimal risk ratios for each strategy.
         winrates (list[float]): List of win rates for each strategy.
         money_made (list[float]): List of money made for each strategy.
     """
-    def __init__(self, stocks: list[MACD_Strategy]):
+    def __init__(self, stocks: list[MACD_Strategy], strategy: str = 'grid', n_trials: int = 30, seed: int = None):
         """
         Initializes a Backtester object.
 
         Args:
             stocks (list[MACD_Strategy]): List of MACD trading strategies to backtest.
+            strategy (str): How the ratios are searched. 'grid' tests every pair of ratios,
+                'coarse' tests a 3x3 grid spread over the ratios and then the pairs around its best.
+                'random' tests n_trials random pairs and 'bayes' lets optuna pick n_trials pairs, both within
+                stop_range and profit_range instead of the grid. 'bayes' needs optuna installed.
+            n_trials (int): The number of pairs tested by the 'random' and 'bayes' strategies.
+            seed (int): Seed of the 'random' and 'bayes' samplers, so repeated runs on the same data pick the same ratios.
         """
+        if strategy not in ('grid', 'coarse', 'random', 'bayes'):
+            raise ValueError("Unknown search strategy: " + strategy)
+        if n_trials < 1:
+            raise ValueError("n_trials must be at least 1, got " + str(n_trials))
+
         self.stocks = stocks
-        self.profit_ratios = [1.25, 1.5, 1.75, 2, 2.25, 2.5, 2.75, 3]
-        self.stop_ratios = [0.95, 0.96, 0.97, 0.98, 0.99, 1] #in relationship to the EMA given in the MACD strategy
+        self.strategy = strategy
+        self.n_trials = n_trials
+        self.seed = seed
+        self.profit_ratios = np.array([1.25, 1.5, 1.75, 2, 2.25, 2.5, 2.75, 3])
+        self.stop_ratios = np.array([0.95, 0.96, 0.97, 0.98, 0.99, 1]) #in relationship to the EMA given in the MACD strategy
+        self.profit_range = (1.1, 3.5) # bounds sampled by the 'random' and 'bayes' strategies
+        self.stop_range = (0.90, 1.0)
+
+        # score = accuracy_weight * winrate + money_weight * money made, the money decides and the winrate breaks ties
+        self.accuracy_weight = 1.0
+        self.money_weight = 1.0
 
         self.optimal_profit_ratio = []
         self.optimal_risk_ratio = []
@@ -43,11 +190,16 @@ class Backtester:
         self.winrates = []
         self.money_made = []
         self.remove_stocks = []
-        for stock in self.stocks:
-            self.add_data(stock)
-        
-        for remove in self.remove_stocks:
-            self.stocks.remove(remove)
+
+        # every stock is backtested independently. The grid kernel releases the GIL so threads run it in parallel
+        # and the data fetches overlap, without having to pickle the strategies and their API clients
+        results = Parallel(n_jobs=-1, prefer='threads')(delayed(self._evaluate_stock)(stock) for stock in self.stocks)
+        for stock, result in zip(self.stocks, results):
+            self._record_result(stock, result)
+
+        # filter in place as the list is shared with the StockContainer's strategies
+        bad = set(id(stock) for stock in self.remove_stocks)
+        self.stocks[:] = [stock for stock in self.stocks if id(stock) not in bad]
 
 
         return
@@ -57,59 +209,136 @@ class Backtester:
         Calculates the optimal profit ratio, optimal risk ratio, win rate, and money made for each strategy.
         And removes any of the stocks which make negative money
         """
+        self._record_result(stock, self._evaluate_stock(stock))
+        return
 
+    def _record_result(self, stock: MACD_Strategy, result: tuple):
+        """
+        Stores the backtest result of a strategy, or marks it for removal if it never won.
 
-        stock_data = stock.get_data()
-        signals = stock_data.loc[stock_data['Long_Position'] == 1].index
-
-
-        greatest_accuracy = 0
-        greatest_money = 0
-
-        for stop in self.stop_ratios:
-
-            for profit in self.profit_ratios:
-                current_wins = 0
-                current_money = 0
-                for signal in signals:
-                    # lets figure out the stop loss first
-                    EMA = stock_data['EMA'].iloc[signal]
-                    stop_loss = self.get_stop_loss(stop, EMA)
-
-                    money_lost = stock_data['Close'].iloc[signal] - stop_loss # money is lost when stop_loss is taken
-
-                    # lets now figure out the take_profit
-                    take_profit = self.get_take_profit(profit, stop_loss)
-
-                    # lets make the moving signal to check when either the stop loss or take profit is reached
-                    moving_signal = signal
-                    while moving_signal != len(stock_data):
-                        if stock_data['Close'].iloc[moving_signal] >= take_profit:
-                            current_wins += 1
-                            current_money += take_profit
-                            break
-
-                        elif stock_data['Close'].iloc[moving_signal] <= stop_loss:
-                            current_money -= money_lost
-                            break
-                        else:
-                            moving_signal += 1
-
-                accuracy = current_wins / len(signals)
-                if (accuracy > greatest_accuracy) or (current_money >= greatest_money): # as we begin to iterate through the higher ratios the accuracy WILL decrease so we also check money
-                    greatest_accuracy = accuracy
-                    greatest_money = current_money
-                    best_profit_ratio = profit
-                    best_stop_ratio = stop
-        if greatest_accuracy != 0:
+        Args:
+            stock (MACD_Strategy): The strategy that was backtested.
+            result (tuple): The result given by _evaluate_stock.
+        """
+        if result is not None:
+            best_profit_ratio, best_stop_ratio, winrate, money = result
             self.optimal_profit_ratio.append(best_profit_ratio)
             self.optimal_risk_ratio.append(best_stop_ratio)
-            self.winrates.append(greatest_accuracy)
-            self.money_made.append(greatest_money)
+            self.winrates.append(winrate)
+            self.money_made.append(money)
         else:
             self.remove_stocks.append(stock)
         return
 
+    def _evaluate_stock(self, stock: MACD_Strategy):
+        """
+        Backtests a strategy over the ratios without changing the backtester.
+
+        Args:
+            stock (MACD_Strategy): The strategy to backtest.
+
+        Returns:
+            tuple: The best profit ratio, best stop ratio, win rate and money made, or None if the strategy never won.
+        """
+        stock_data = stock.get_data()
+        # single precision is plenty for prices and halves the memory the kernel scans
+        close = stock_data['Close'].to_numpy(dtype=np.float32)
+        ema = stock_data['EMA'].to_numpy(dtype=np.float32)
+        signals = np.flatnonzero(stock_data['Long_Position'].to_numpy() == 1).astype(np.int64)
+        extremes = _running_extremes(close, signals) # shared by every ratio tested below
+
+        if self.strategy in ('random', 'bayes'):
+            best_stop_ratio, best_profit_ratio, greatest_accuracy, greatest_money = self._search_trials(close, ema, signals, extremes)
+            if greatest_accuracy == 0:
+                return None
+            return best_profit_ratio, best_stop_ratio, greatest_accuracy, greatest_money
+
+        n_stops = len(self.stop_ratios)
+        n_profits = len(self.profit_ratios)
+        if self.strategy == 'coarse':
+            # the lowest, middle and highest ratios first, then the neighbours of the best of those
+            coarse_stops = np.unique(np.linspace(0, n_stops - 1, 3).round().astype(int))
+            coarse_profits = np.unique(np.linspace(0, n_profits - 1, 3).round().astype(int))
+            i, j, _, _ = self._search_grid(close, ema, signals, extremes, coarse_stops, coarse_profits)
+            fine_stops = np.arange(max(i - 1, 0), min(i + 2, n_stops))
+            fine_profits = np.arange(max(j - 1, 0), min(j + 2, n_profits))
+            i, j, greatest_accuracy, greatest_money = self._search_grid(close, ema, signals, extremes, fine_stops, fine_profits)
+        else:
+            i, j, greatest_accuracy, greatest_money = self._search_grid(close, ema, signals, extremes, np.arange(n_stops), np.arange(n_profits))
+
+        if greatest_accuracy == 0:
+            return None
+        return self.profit_ratios[j], self.stop_ratios[i], greatest_accuracy, greatest_money
+
+    def _search_grid(self, close: np.ndarray, ema: np.ndarray, signals: np.ndarray, extremes: tuple, stop_idx: np.ndarray, profit_idx: np.ndarray):
+        """
+        Backtests the given part of the ratio grid and finds its best pair of ratios.
+
+        Args:
+            close (np.ndarray): The closing prices.
+            ema (np.ndarray): The EMA at each closing price.
+            signals (np.ndarray): The positions of the long signals.
+            extremes (tuple): The running max and min tables given by _running_extremes.
+            stop_idx (np.ndarray): The indices of the stop ratios to test.
+            profit_idx (np.ndarray): The indices of the profit ratios to test.
+
+        Returns:
+            tuple: The index of the best stop ratio, the index of the best profit ratio, its win rate and money made.
+        """
+        accuracy_grid, money_grid = _eval_grid(close, ema, signals, *extremes, self.stop_ratios[stop_idx].astype(np.float32), self.profit_ratios[profit_idx].astype(np.float32), self.accuracy_weight, self.money_weight)
+
+        # as we begin to iterate through the higher ratios the accuracy WILL decrease so the score also weighs money
+        scores = self.accuracy_weight * accuracy_grid + self.money_weight * money_grid
+        scores[np.isnan(scores)] = -np.inf # abandoned as they could not beat the best
+        i, j = np.unravel_index(np.argmax(scores), scores.shape)
+
+        return stop_idx[i], profit_idx[j], accuracy_grid[i, j], money_grid[i, j]
+
+    def _search_trials(self, close: np.ndarray, ema: np.ndarray, signals: np.ndarray, extremes: tuple):
+        """
+        Backtests n_trials pairs of ratios sampled within stop_range and profit_range and finds the best of them.
+        The pairs are drawn at random for the 'random' strategy and by optuna's TPE sampler for the 'bayes' strategy.
+
+        Args:
+            close (np.ndarray): The closing prices.
+            ema (np.ndarray): The EMA at each closing price.
+            signals (np.ndarray): The positions of the long signals.
+            extremes (tuple): The running max and min tables given by _running_extremes.
+
+        Returns:
+            tuple: The best stop ratio, the best profit ratio, its win rate and money made.
+        """
+        def evaluate(stop: float, profit: float):
+            accuracy_grid, money_grid = _eval_grid(close, ema, signals, *extremes, np.array([stop], dtype=np.float32), np.array([profit], dtype=np.float32), self.accuracy_weight, self.money_weight)
+            return accuracy_grid[0, 0], money_grid[0, 0]
+
+        if self.strategy == 'bayes':
+            import optuna # only needed by this strategy
+
+            def objective(trial):
+                accuracy, money = evaluate(trial.suggest_float('stop', *self.stop_range), trial.suggest_float('profit', *self.profit_range))
+                trial.set_user_attr('accuracy', float(accuracy))
+                trial.set_user_attr('money', float(money))
+                return self.accuracy_weight * accuracy + self.money_weight * money
+
+            optuna.logging.set_verbosity(optuna.logging.WARNING)
+            study = optuna.create_study(direction='maximize', sampler=optuna.samplers.TPESampler(seed=self.seed))
+            study.optimize(objective, n_trials=self.n_trials)
+            best = study.best_trial
+            return best.params['stop'], best.params['profit'], best.user_attrs['accuracy'], best.user_attrs['money']
+
+        rng = np.random.default_rng(self.seed)
+        stops = rng.uniform(*self.stop_range, self.n_trials)
+        profits = rng.uniform(*self.profit_range, self.n_trials)
+
+        best_score = -np.inf
+        for stop, profit in zip(stops, profits):
+            accuracy, money = evaluate(stop, profit)
+            score = self.accuracy_weight * accuracy + self.money_weight * money
+            if score > best_score:
+                best_score = score
+                best = stop, profit, accuracy, money
+        return best
 
             
     def set_ratios(self):
@@ -1,8 +1,75 @@
-from ta.trend import MACD
 from account import Account
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np 
+from numba import njit
+
+
+@njit(cache=True)
+def _compute_indicators(close: np.ndarray, fast: int = 12, slow: int = 26, sign: int = 9, span: int = 100):
+    """
+    Calculates the MACD indicators, the EMA and the signals in a single pass over the closing prices.
+    Every EMA is seeded with its first value (no adjustment) and the MACD values are NaN until their
+    window is full, the same as the ta library's MACD.
+
+    Args:
+        close (np.ndarray): The closing prices.
+        fast (int): The span of the fast EMA of the MACD line.
+        slow (int): The span of the slow EMA of the MACD line.
+        sign (int): The span of the signal line EMA.
+        span (int): The span of the EMA used as the trend filter and stop loss.
+
+    Returns:
+        tuple: The MACD line, MACD signal line, MACD histogram, EMA, long signal, long position, short signal and short position.
+    """
+    n = close.shape[0]
+    macd = np.full(n, np.nan)
+    signal_line = np.full(n, np.nan)
+    diff = np.full(n, np.nan)
+    ema = np.empty(n)
+    signal_long = np.zeros(n)
+    long_pos = np.full(n, np.nan)
+    signal_short = np.zeros(n)
+    short_pos = np.full(n, np.nan)
+    if n == 0:
+        return macd, signal_line, diff, ema, signal_long, long_pos, signal_short, short_pos
+
+    alpha_fast = 2.0 / (fast + 1)
+    alpha_slow = 2.0 / (slow + 1)
+    alpha_sign = 2.0 / (sign + 1)
+    alpha = 2.0 / (span + 1)
+
+    ema_fast = close[0]
+    ema_slow = close[0]
+    ema_sign = 0.0
+    ema[0] = close[0]
+    for t in range(n):
+        if t > 0:
+            ema_fast = alpha_fast * close[t] + (1 - alpha_fast) * ema_fast
+            ema_slow = alpha_slow * close[t] + (1 - alpha_slow) * ema_slow
+            ema[t] = alpha * close[t] + (1 - alpha) * ema[t - 1]
+
+        if t >= slow - 1:
+            macd[t] = ema_fast - ema_slow
+            # the signal line starts from the first MACD value
+            if t == slow - 1:
+                ema_sign = macd[t]
+            else:
+                ema_sign = alpha_sign * macd[t] + (1 - alpha_sign) * ema_sign
+            if t >= slow + sign - 2:
+                signal_line[t] = ema_sign
+                diff[t] = macd[t] - ema_sign
+
+        if macd[t] < 0 and macd[t] > signal_line[t] and close[t] > ema[t]:
+            signal_long[t] = 1.0
+        if macd[t] > 0 and macd[t] < signal_line[t] and close[t] < ema[t]:
+            signal_short[t] = 1.0
+
+        if t > 0:
+            long_pos[t] = signal_long[t] - signal_long[t - 1]
+            short_pos[t] = signal_short[t] - signal_short[t - 1]
+
+    return macd, signal_line, diff, ema, signal_long, long_pos, signal_short, short_pos
 
 
 
@@ -17,13 +84,14 @@ class MACD_Strategy:
         stop_loss_percentage (float): The percentage of the EMA used as the stop loss.
         winrate (float): The win rate of the strategy (default is 1).
     """
-    def __init__(self, account: Account, symbol: str):
+    def __init__(self, account: Account, symbol: str, prefetched_close_dates: tuple = None):
         """
         Initializes a MACD_Strategy object.
 
         Args:
             account (Account): The trading account associated with the strategy.
             symbol (str): The symbol of the stock being traded.
+            prefetched_close_dates (tuple): Closing prices and dates already fetched for the symbol, used instead of fetching them again.
         """
 
         self.account = account
@@ -33,6 +101,9 @@ class MACD_Strategy:
         self.stop_loss_percentage = 0.95 # % of the EMA. So 95% of the EMA when the purchase was made (backtest needed)
         self.winrate = 1 #if it has not been set
 
+        self._cached_df = None # filled in by refresh() so the data is only fetched and computed once per cycle
+        self._prefetched_close_dates = prefetched_close_dates
+
 
     def execute(self):
         """
@@ -51,10 +122,14 @@ class MACD_Strategy:
         
         buy_qty = notional / current_cost
 
-        if df['Long_Position'].iloc[-1]: #if there was a signal in the previous day
-            self.account.long_stock(self.symbol, buy_qty, df['EMA'], self.stop_loss_percentage, self.ratio, notional)
+        long_position = df['Long_Position'].to_numpy()
+        short_position = df['Short_Position'].to_numpy()
+        ema = df['EMA'].to_numpy()
+
+        if long_position[-1]: #if there was a signal in the previous day
+            self.account.long_stock(self.symbol, buy_qty, ema[-1], self.stop_loss_percentage, self.ratio, notional)
             return # make a LONG
-        elif df['Short_Position'].iloc[-1]:
+        elif short_position[-1]:
             print("A Short Position has been detected")
             return #make a short
         else: 
@@ -90,8 +165,11 @@ class MACD_Strategy:
         plt.hist(df.index , weights = df['Diff'], bins = len(df['Diff']), label='Histogram')
 
         # Signal
-        plt.plot(df[df['Long_Position'] == 1].index,  df['Close'][df['Long_Position'] == 1],  '^', markersize = 5, color = 'green', label = 'Long')
-        plt.plot(df[df['Short_Position'] == 1].index,  df['Close'][df['Short_Position'] == 1],  'v', markersize = 5, color = 'red', label = 'Short')
+        close = df['Close'].to_numpy()
+        longs = np.flatnonzero(df['Long_Position'].to_numpy() == 1)
+        shorts = np.flatnonzero(df['Short_Position'].to_numpy() == 1)
+        plt.plot(longs,  close[longs],  '^', markersize = 5, color = 'green', label = 'Long')
+        plt.plot(shorts,  close[shorts],  'v', markersize = 5, color = 'red', label = 'Short')
 
 
         plt.xlabel('Date')
@@ -105,61 +183,75 @@ class MACD_Strategy:
     
 
 
-    def MACD(self):
+    def MACD(self, close_series: pd.Series = None):
         """
         Calculates the MACD line, MACD signal line, and MACD histogram.
 
+        Args:
+            close_series (pd.Series): The closing prices. The strategy's data is used if not given.
+
         Returns:
             list: A list containing the MACD line, MACD signal line, and MACD histogram.
         """
-        close_prices = self.account.get_barset_day_close(self.symbol)
+        if close_series is None:
+            close_series = self.get_data()['Close'] # already fetched, no need for another request
 
-        df = pd.DataFrame(close_prices, columns = ['Close'])
+        macd_line, macd_signal, macd_diff = _compute_indicators(close_series.to_numpy(dtype=np.float64))[:3]
 
-        macd_data = MACD(df['Close'])
-
-        res = [macd_data.macd(),macd_data.macd_signal(),macd_data.macd_diff()]
+        res = [macd_line, macd_signal, macd_diff]
         return res
     
 
     def get_data(self):
         """
-        Gets the historical data for the symbol and calculates the MACD indicators.
+        Gets the historical data for the symbol and the MACD indicators.
+        The data is only calculated on the first call, use refresh() to recalculate it.
+
+        Returns:
+            pd.DataFrame: The dataframe containing the historical data and MACD indicators.
+        """
+        if self._cached_df is None:
+            self.refresh(self._prefetched_close_dates)
+            self._prefetched_close_dates = None
+        return self._cached_df
+
+    def refresh(self, close_dates: tuple = None):
+        """
+        Fetches the historical data for the symbol and recalculates the MACD indicators.
         Also calculates where the signals are
 
+        Args:
+            close_dates (tuple): Closing prices and dates already fetched for the symbol. Fetched from the account if not given.
+
         Returns:
             pd.DataFrame: The dataframe containing the historical data and MACD indicators.
         """
-        close_prices, dates = self.account.get_barset_day_close_and_date(self.symbol)
+        if close_dates is None:
+            close_dates = self.account.get_barset_day_close_and_date(self.symbol)
+        close_prices, dates = close_dates
 
         df = pd.DataFrame(close_prices, columns = ['Close'])
 
-        df['dates'] = dates
-        df.set_index('dates')
+        df['dates'] = dates # kept as a column, the backtester and plot rely on the positional index
 
 
-        macd_line, macd_signal, macd_diff = self.MACD()
+        macd_line, macd_signal, macd_diff, ema, signal_long, long_pos, signal_short, short_pos = _compute_indicators(df['Close'].to_numpy(dtype=np.float64))
          
         df['MACD'] = macd_line
         df["Signal_line"] = macd_signal
         df["Diff"] = macd_diff
 
-        ema = df['Close'].ewm(span=100, adjust=False).mean() #n = 100, for 100 EMA
-
-        df['EMA'] = ema
-
-        df['Signal_Long'] = 0.0
-
-        df['Signal_Long'] = np.where((df['MACD'] < 0) & (df['MACD'] > df['Signal_line']) & (df['Close'] > df['EMA'])  , 1.0, 0.0)
+        df['EMA'] = ema #n = 100, for 100 EMA
 
-        df['Long_Position'] = df['Signal_Long'].diff()
+        df['Signal_Long'] = signal_long
 
-        df['Signal_Short'] = 0.0
+        df['Long_Position'] = long_pos
 
-        df['Sigial_Short'] = np.where((df['MACD'] > 0) & (df['MACD'] < df['Signal_line']) & (df['Close'] < df['EMA'])  , 1.0, 0.0)
+        df['Signal_Short'] = signal_short
 
-        df['Short_Position'] = df['Sigial_Short'].diff()
+        df['Short_Position'] = short_pos
 
+        self._cached_df = df
         return df
     
     def set_profit_ratio(self, ratio: int):
@@ -27,8 +27,8 @@ class StockContainer:
         """
         self.backtester.execute()
         remove_stocks = self.backtester.remove_stocks
-        for stock in remove_stocks:
-            self.stocks.remove(stock.symbol)
+        bad_symbols = {stock.symbol for stock in remove_stocks}
+        self.stocks[:] = [stock for stock in self.stocks if stock not in bad_symbols]
         self.backtester.set_ratios()
 
 
@@ -37,14 +37,18 @@ class StockContainer:
         Creates MACD_Strategy objects for each stock in the list.
         """
         self.MACD_objects = []
+        barsets = self.account.get_barsets_day_close_and_date(self.stocks) # one request for every stock
         for stock in self.stocks:
-            self.MACD_objects.append(MACD_Strategy(self.account, stock))
+            self.MACD_objects.append(MACD_Strategy(self.account, stock, barsets.get(stock)))
 
 
     def execute(self):
         """
         Executes the backtester and MACD strategies.
         """
+        barsets = self.account.get_barsets_day_close_and_date([MACD_object.symbol for MACD_object in self.MACD_objects])
+        for MACD_object in self.MACD_objects:
+            MACD_object.refresh(barsets.get(MACD_object.symbol)) # get the latest market data once, the backtester and strategies share it
         self.backtester.execute()
         for MACD_object in self.MACD_objects:
             MACD_object.execute()
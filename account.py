@@ -24,6 +24,7 @@ class Account:
         get_barset_day(symbol): Get the daily barset for a symbol.
         get_barset_day_close(symbol): Get the closing prices from the daily barset for a symbol.
         get_barset_day_close_and_date(symbol): Get the closing prices and dates from the daily barset for a symbol.
+        get_barsets_day_close_and_date(symbols): Get the closing prices and dates from the daily barsets for several symbols in one request.
      """
 
     def __init__(self, api_key: str, secret_key: str, base_url: str):
@@ -203,6 +204,23 @@ class Account:
         return self.api.get_position(symbol).qty
 
 
+    def _date_range(self):
+        """
+        Get the start and end dates of the daily barsets, covering the past 5 years.
+
+        Returns:
+            tuple: Tuple containing the start and end dates as API timestamp strings.
+        """
+        # free subscription has a 15 minute delay
+        end_date = datetime.datetime.now()
+        end_date = end_date - datetime.timedelta(days = 1)
+        start_date = end_date - datetime.timedelta(days = 1825) # past 5 years
+
+        end_date = end_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        start_date = start_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+        return start_date, end_date
+
     """
     returns the daily barset from up to the last 6 years
     """
@@ -216,14 +234,7 @@ class Account:
         Returns:
             list: List of tradeapi.entity.Bar objects representing the barset.
         """
-        # free subscription has a 15 minute delay
-        end_date = datetime.datetime.now()
-        end_date = end_date - datetime.timedelta(days = 1)
-        start_date = end_date - datetime.timedelta(days = 1825)
-
-        end_date = end_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        start_date = start_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        
+        start_date, end_date = self._date_range()
 
         return self.api.get_bars(symbol, '1Day', limit=10000, start=start_date, end=end_date)
     
@@ -236,23 +247,13 @@ class Account:
             symbol (str): Stock symbol.
 
         Returns:
-            list: List of closing prices.
+            np.ndarray: Array of closing prices.
         """
-        # free subscription has a 15 minute delay
-        end_date = datetime.datetime.now()
-        end_date = end_date - datetime.timedelta(days = 1)
-        start_date = end_date - datetime.timedelta(days = 1825)
-
-        end_date = end_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        start_date = start_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        start_date, end_date = self._date_range()
 
-        barset = self.api.get_bars(symbol, '1Day', limit=10000, start=start_date, end=end_date)
+        barset = self.api.get_bars(symbol, '1Day', limit=10000, start=start_date, end=end_date).df
 
-        close_prices = []
-        for bar in barset:
-            close_prices.append(bar.c)
-
-        return close_prices
+        return barset['close'].to_numpy()
 
     def get_barset_day_close_and_date(self, symbol):
         """
@@ -262,23 +263,36 @@ class Account:
             symbol (str): Stock symbol.
 
         Returns:
-            tuple: Tuple containing a list of closing prices and a list of dates.
+            tuple: Tuple containing an array of closing prices and an array of dates.
         """
-        # free subscription has a 15 minute delay
-        end_date = datetime.datetime.now()
-        end_date = end_date - datetime.timedelta(days = 1)
-        start_date = end_date - datetime.timedelta(days = 1825) # past 5 years
+        start_date, end_date = self._date_range()
 
-        end_date = end_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        start_date = start_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        barset = self.api.get_bars(symbol, '1Day', limit=10000, start=start_date, end=end_date).df
+
+        return barset['close'].to_numpy(), barset.index.to_numpy()
+
+    def get_barsets_day_close_and_date(self, symbols: list[str]):
+        """
+        Get the closing prices and dates from the daily barsets for several symbols in one request.
+
+        Args:
+            symbols (list[str]): Stock symbols.
+
+        Returns:
+            dict[str, tuple[np.ndarray, np.ndarray]]: Closing prices and dates for each symbol which has bars.
+        """
+        if not symbols: # every stock may have been removed by the backtester, nothing to request
+            return {}
 
-        barset = self.api.get_bars(symbol, '1Day', limit=10000, start=start_date, end=end_date)
+        start_date, end_date = self._date_range()
 
-        close_prices = []
-        dates = []
-        for bar in barset:
-            close_prices.append(bar.c)
-            dates.append(bar.t)
+        # no limit as it counts the bars of every symbol together, the pages are followed until all bars are fetched
+        barsets = self.api.get_bars(symbols, '1Day', start=start_date, end=end_date).df
 
+        res = {}
+        if barsets.empty:
+            return res
+        for symbol, barset in barsets.groupby('symbol'):
+            res[symbol] = (barset['close'].to_numpy(), barset.index.to_numpy())
 
-        return close_prices, dates
\ No newline at end of file
+        return res
\ No newline at end of file
@@ -21,6 +21,8 @@ main.add_stock("NVDA")
 schedule.every().day.at("10:00").do(main.execute)
 
 
+# sleep until the next job is due instead of waking up every second
 while True:
-    schedule.run_pending()
-    time.sleep(1)
\ No newline at end of file
+    n = schedule.idle_seconds()
+    time.sleep(max(n, 1) if n else 1)
+    schedule.run_pending()
\ No newline at end of file